@@ -1,12 +1,13 @@
 import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from utils.func import (
     init_notion_client,
-    get_children_rec,
+    get_children_cached,
     create_daily_page,
     setup_logger,
     process_input_data,
-    # update_yesterday_page,
+    update_yesterday_page,
 )
 
 
@@ -46,18 +47,44 @@ if __name__ == "__main__":
         # yesterday_step_number,
     )
 
-    notion = init_notion_client(logger)
+    # Single top-level handler : the helpers let transient failures
+    # propagate so the transport-level retries get a chance first and a
+    # real failure stops the run instead of cascading into NoneType errors
+    try:
+        notion = init_notion_client(logger)
 
-    cleaned_data = process_input_data(data, logger)
+        # Read both ids once, after init_notion_client has loaded .env
+        template_page_id = os.environ.get("TEMPLATE_PAGE_ID")
+        daily_database_id = os.environ.get("DAILY_DATABASE_ID")
 
-    # Get Yesterday Page and Update the step number data
-    # update_yesterday_page()
+        cleaned_data = process_input_data(data, logger)
 
-    # Create the Daily Page with sleep data
+        # Get the page children from an example page to create the daily template like the other one
+        children = get_children_cached(notion, template_page_id, logger)
 
-    # Get the page children from an example page to create the daily template like the other one
-    children = get_children_rec(notion, os.environ.get("TEMPLATE_PAGE_ID"), logger)
-
-    create_daily_page(
-        notion, os.environ.get("DAILY_DATABASE_ID"), cleaned_data, children, logger
-    )
+        # The daily page creation and yesterday's step update touch different
+        # resources, so run both writes concurrently on the pooled client
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(
+                    create_daily_page,
+                    notion,
+                    daily_database_id,
+                    cleaned_data,
+                    children,
+                    logger,
+                ),
+                executor.submit(
+                    update_yesterday_page,
+                    notion,
+                    daily_database_id,
+                    cleaned_data,
+                    logger,
+                ),
+            ]
+            wait(futures)
+            for future in futures:
+                future.result()
+    except Exception as e:
+        logger.error("Morning script failed : %s", e)
+        raise SystemExit(1)
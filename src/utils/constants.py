@@ -3,3 +3,4 @@ from pathlib import Path
 
 ROOT_DIR = Path(__file__).parent.parent.parent.absolute()
 LOG_DIR = ROOT_DIR / "log"
+TEMPLATE_CACHE_FILE = ROOT_DIR / ".template_cache.json"
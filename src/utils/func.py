@@ -1,18 +1,47 @@
+import atexit
+import copy
 import json
 from dotenv import load_dotenv
 import os
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+import httpx
+
 from notion_client import Client
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import queue
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    TimedRotatingFileHandler,
+)
+
+from utils.constants import LOG_DIR, TEMPLATE_CACHE_FILE
+
+
+# Shared formatter, built once instead of per setup_logger call
+LOG_FORMATTER = logging.Formatter(
+    "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
 
-import pandas as pd
-from utils.constants import LOG_DIR
 
+def setup_logger(name, level=logging.INFO):
+    """Set up a logger with a non-blocking timed rotating file handler."""
+    # Create a logger
+    logger = logging.getLogger(name)
+
+    # getLogger returns the same instance on repeated calls : bail out
+    # early so handlers are not duplicated (each duplicate would format
+    # and write every record again)
+    if logger.handlers:
+        return logger
+
+    logger.setLevel(level)
+    logger.propagate = False
 
-def setup_logger(name, level=logging.DEBUG):
-    """Set up a logger with timed rotating file handler."""
     # Ensure the log directory exists
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
@@ -21,176 +50,346 @@ def setup_logger(name, level=logging.DEBUG):
     # The actual date part will be managed by TimedRotatingFileHandler
     log_file = LOG_DIR / f"{datetime.now().strftime('%Y-%m-%d')}.log"  # _%Y-%m-%d
 
-    # Create a logger
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-
-    # Create a formatter
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-
     # Create a timed rotating file handler
     file_handler = TimedRotatingFileHandler(
         log_file, when="W0", interval=1, backupCount=4, utc=True
     )
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    file_handler.setFormatter(LOG_FORMATTER)
 
     # Also create a console handler for output to the terminal
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
+    console_handler.setFormatter(LOG_FORMATTER)
     console_handler.setLevel(level)
-    logger.addHandler(console_handler)
 
-    return logger
+    # Hand records to a background listener thread : callers only pay an
+    # in-memory enqueue instead of blocking on disk and terminal writes
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
 
+    logger.addHandler(QueueHandler(log_queue))
 
-def init_notion_client(logger):
+    return logger
 
+
+@lru_cache(maxsize=1)
+def _load_env():
+    """Load .env once per process and return the Notion token."""
     load_dotenv()
     notion_token = os.getenv("NOTION_TOKEN")
-    notion = Client(auth=notion_token)
+    if not notion_token:
+        raise RuntimeError("NOTION_TOKEN is not set")
+    return notion_token
+
+
+def init_notion_client(logger):
+
+    notion_token = _load_env()
+
+    # Pooled transport so every API call after the first reuses the same
+    # TLS connection instead of paying a fresh TCP+TLS handshake, with
+    # connect retries so a transient network blip does not kill the run
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_keepalive_connections=16, max_connections=16),
+        transport=httpx.HTTPTransport(retries=3),
+    )
+    atexit.register(http_client.close)
+
+    notion = Client(auth=notion_token, client=http_client)
 
     logger.info("Client succesfully initialised")
 
     return notion
 
 
+# Reciprocals as constants so the hot path multiplies instead of dividing
+MIN_TO_HOURS = 1 / 60
+SEC_TO_HOURS = 1 / 3600
+
+# Month lookup for the fixed 'dd MMM YYYY at HH:MM' input layout
+MONTHS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+
+
 def convert_duration_to_hours(duration_str):
     """
     Convert duration string to decimal hours.
-    Handles both 'h:mm:ss' and 'm:ss' formats.
+    Handles 'h:mm:ss', 'm:ss' and 'ss' formats.
     """
-    parts = duration_str.split(":")
-
-    # If duration is in 'h:mm:ss' format
+    # Fast path : the upstream data is a canonical zero-padded 'h:mm:ss',
+    # parsed by position straight off the ASCII digits — no split, no
+    # list allocation, no per-part int() call
+    if len(duration_str) == 7 and duration_str[1] == ":":
+        hours = ord(duration_str[0]) - 48
+        minutes = (ord(duration_str[2]) - 48) * 10 + (ord(duration_str[3]) - 48)
+        seconds = (ord(duration_str[5]) - 48) * 10 + (ord(duration_str[6]) - 48)
+        return hours + minutes * MIN_TO_HOURS + seconds * SEC_TO_HOURS
+
+    # Generic path for the other layouts
+    parts = duration_str.split(":", 2)
+
+    # Common 'h:mm:ss' case first : straight to integers, no branch tree
     if len(parts) == 3:
-        hours, minutes, seconds = parts
-    # If duration is in 'm:ss' format
-    elif len(parts) == 2:
-        hours = 0  # No hours part in 'm:ss' format
-        minutes, seconds = parts
-    elif len(parts) == 1:
-        hours = 0  # No hours part in 'ss' format
-        minutes = 0  # No minutes part in 'ss' format
-        seconds = parts
-    else:
-        raise ValueError("Duration format not recognized")
+        hours, minutes, seconds = map(int, parts)
+        return hours + minutes * MIN_TO_HOURS + seconds * SEC_TO_HOURS
+
+    # 'm:ss' format
+    if len(parts) == 2:
+        minutes, seconds = map(int, parts)
+        return minutes * MIN_TO_HOURS + seconds * SEC_TO_HOURS
+
+    # 'ss' format
+    return int(parts[0]) * SEC_TO_HOURS
+
+
+def parse_input_date(date_str):
+    """
+    Parse the fixed 'dd MMM YYYY at HH:MM' layout sent by the Shortcut.
+    Splitting on known separators and indexing the month table is far
+    faster than strptime re-walking the format string on every call.
+    """
+    date_part, time_part = date_str.split(" at ")
+    day, month_str, year = date_part.split(" ")
+    hour, minute = time_part.split(":")
+
+    return datetime(
+        int(year), MONTHS[month_str], int(day), int(hour), int(minute)
+    )
+
+
+def update_yesterday_page(notion, database_id, dict_cleaned_data: dict, logger):
+
+    yesterday = dict_cleaned_data["sleep_end_date"] - timedelta(days=1)
+    target_date = yesterday.strftime("%Y-%m-%d")
+
+    # Ask Notion for exactly yesterday's page instead of fetching the
+    # whole week and filtering client-side
+    pages_in_db = notion.databases.query(
+        database_id=database_id,
+        filter={"property": "🗓 Date", "date": {"equals": target_date}},
+        page_size=1,
+    )
+
+    results = pages_in_db["results"]
+    if not results:
+        logger.error("update_yesterday_page - No page found for %s", target_date)
+        return
+
+    response = notion.pages.update(
+        results[0]["id"],
+        properties={
+            "Steps": {"number": dict_cleaned_data.get("total_yesterday_steps", 0)}
+        },
+    )
+
+    logger.info("Yesterday Page updated with id : %s", response["id"])
 
-    # Convert parts to integers
-    hours = int(hours)
-    minutes = int(minutes)
-    seconds = int(seconds)
 
-    # Calculate total hours as a decimal
-    total_hours = hours + minutes / 60 + seconds / 3600
+# Bounded worker count so concurrent fetches stay close to Notion's rate limit
+MAX_FETCH_WORKERS = 8
 
-    return total_hours
+# Block types never worth recursing into : synced blocks cannot be
+# replayed, and following links into other pages or databases would pull
+# in their entire subtrees at one API call per block
+SKIP_RECURSION = frozenset(
+    {"synced_block", "child_page", "child_database", "link_to_page", "template"}
+)
 
 
-# def update_yesterday_page():
+def _list_children(notion, page_id):
+    """Retrieve every direct child of a block, following pagination."""
+    # Explicit max page_size : one call returns up to 100 children
+    response = notion.blocks.children.list(block_id=page_id, page_size=100)
+    results = response.get("results", [])
+
+    # Follow the cursor so parents with more than 100 children are not
+    # silently truncated ; each cursor comes from the previous response,
+    # so extra pages of one parent overlap with its siblings in the pool
+    while response.get("has_more"):
+        response = notion.blocks.children.list(
+            block_id=page_id,
+            page_size=100,
+            start_cursor=response["next_cursor"],
+        )
+        results.extend(response.get("results", []))
+
+    return results
 
 
 def get_children_rec(notion, page_id, logger):
     blocks = []
+    # Level-order traversal : fetch every block of the current depth
+    # concurrently instead of recursing one serial API call at a time
+    frontier = [(blocks, page_id)]
+
+    with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+        while frontier:
+            futures = {
+                executor.submit(_list_children, notion, block_id): (
+                    container,
+                    block_id,
+                )
+                for container, block_id in frontier
+            }
+            frontier = []
+
+            for future in as_completed(futures):
+                container, block_id = futures[future]
+                # Let failures propagate to the script-level handler ;
+                # swallowing them here produced half-built trees
+                children = future.result()
+
+                for child in children:
+                    child_type = child["type"]
+
+                    # Keep only what pages.create accepts back : ids,
+                    # timestamps and parent pointers are ignored or
+                    # rejected by Notion and inflate the request body
+                    block = {
+                        "object": "block",
+                        "type": child_type,
+                        child_type: child[child_type],
+                    }
+
+                    # Check if this block can have children we should fetch
+                    if (
+                        child.get("has_children", False)
+                        and child_type not in SKIP_RECURSION
+                    ):
+                        grandchildren = []
+                        block[child_type]["children"] = grandchildren
+                        frontier.append((grandchildren, child["id"]))
+
+                    container.append(block)
+
+    return blocks
+
+
+def get_children_cached(notion, page_id, logger, cache_path=TEMPLATE_CACHE_FILE):
+    """
+    Return the recursed children of a page, served from a local JSON
+    cache while the page's last_edited_time is unchanged on Notion.
+    The template page rarely changes, so the steady-state path costs a
+    single pages.retrieve call instead of one call per nested block.
+    """
+    page = notion.pages.retrieve(page_id)
+    last_edited_time = page.get("last_edited_time")
+
     try:
-        # Retrieve the children of the block
-        response = notion.blocks.children.list(block_id=page_id)
-        children = response.get("results", [])
-
-        for child in children:
-            # Check if this block can have children and is not a synced_block
-            if child.get("has_children", False):
-                if not child["type"] == "synced_block":
-                    child[child["type"]]["children"] = get_children_rec(
-                        notion, child["id"], logger
-                    )
-
-            blocks.append(child)
-    except Exception as e:
-        logger.error(
-            f"get_children_rec - Failed to retrieve or process block {page_id}: {e}"
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if (
+            cache.get("page_id") == page_id
+            and cache.get("last_edited_time") == last_edited_time
+        ):
+            logger.info("Template cache hit for page %s", page_id)
+            return cache["children"]
+    except (OSError, ValueError):
+        # Missing or unreadable cache : fall through to a full fetch
+        pass
+
+    children = get_children_rec(notion, page_id, logger)
+
+    # Atomic write : dump to a temp file then rename over the cache so a
+    # crash mid-write cannot leave a truncated file behind
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(
+            {
+                "page_id": page_id,
+                "last_edited_time": last_edited_time,
+                "children": children,
+            },
+            f,
         )
-    return blocks
+    os.replace(tmp_path, cache_path)
+
+    logger.info("Template cache refreshed for page %s", page_id)
+
+    return children
 
 
 def process_input_data(data, logger):
 
-    cleaned_data = {}
-    try:
-        input_data: dict = json.loads(data)
-
-        format_date_input = "%d %b %Y at %H:%M"
-
-        cleaned_data = {
-            "sleep_end_date": datetime.strptime(
-                input_data.get(
-                    "sleep_end_date", datetime.now().strftime(format_date_input)
-                ),
-                format_date_input,
-            ),
-            "total_daily_sleep": convert_duration_to_hours(
-                input_data.get("sleep_duration", 0)
-            ),
-            "total_yesterday_steps": input_data.get("steps_value", 0),
-        }
+    input_data: dict = json.loads(data)
+
+    raw_end_date = input_data.get("sleep_end_date")
+
+    cleaned_data = {
+        "sleep_end_date": (
+            parse_input_date(raw_end_date) if raw_end_date else datetime.now()
+        ),
+        "total_daily_sleep": convert_duration_to_hours(
+            input_data.get("sleep_duration", 0)
+        ),
+        "total_yesterday_steps": input_data.get("steps_value", 0),
+    }
+    # Guard the repr of the whole dict behind the effective level
+    if logger.isEnabledFor(logging.INFO):
         logger.info("Input Data Processed results : %s", cleaned_data)
 
-    except Exception as e:
-        logger.error(e)
-
     return cleaned_data
 
 
-def create_daily_page(notion, database_id, dict_cleaned_data: dict, children, logger):
+# Static skeleton of a daily page's properties ; only the three variable
+# fields are filled in per call. The annotations block is omitted since
+# Notion applies the defaults server-side, which also shrinks the payload
+NEW_PAGE_TEMPLATE = {
+    "🗓 Date": {
+        "id": "L%23)%3A",
+        "type": "date",
+        "date": {"start": None, "end": None, "time_zone": None},
+    },
+    "Sleep": {
+        "id": "rdCQ",
+        "type": "number",
+        "number": 0,
+    },
+    "✍️": {
+        "id": "title",
+        "type": "title",
+        "title": [
+            {
+                "type": "text",
+                "text": {"content": "", "link": None},
+            }
+        ],
+    },
+}
 
-    try:
-
-        # Date for the title
-        date_title = dict_cleaned_data["sleep_end_date"].strftime("%B %d, %Y")
-        date_property = dict_cleaned_data["sleep_end_date"].strftime("%Y-%m-%d")
 
-        new_page = {
-            "🗓 Date": {
-                "id": "L%23)%3A",
-                "type": "date",
-                "date": {"start": date_property, "end": None, "time_zone": None},
-            },
-            "Sleep": {
-                "id": "rdCQ",
-                "type": "number",
-                "number": dict_cleaned_data.get("total_daily_sleep", 0),
-            },
-            "✍️": {
-                "id": "title",
-                "type": "title",
-                "title": [
-                    {
-                        "type": "text",
-                        "text": {"content": date_title, "link": None},
-                        "annotations": {
-                            "bold": False,
-                            "italic": False,
-                            "strikethrough": False,
-                            "underline": False,
-                            "code": False,
-                            "color": "default",
-                        },
-                    }
-                ],
-            },
-        }
-
-        # Create the new page
-        response = notion.pages.create(
-            parent={"database_id": database_id},
-            icon={"emoji": "✍🏻"},
-            properties=new_page,
-            children=children,
-        )
+def create_daily_page(notion, database_id, dict_cleaned_data: dict, children, logger):
 
-        logger.info("Page Created with id : %s ", response["id"])
+    # Date for the title
+    date_title = dict_cleaned_data["sleep_end_date"].strftime("%B %d, %Y")
+    date_property = dict_cleaned_data["sleep_end_date"].strftime("%Y-%m-%d")
+
+    new_page = copy.deepcopy(NEW_PAGE_TEMPLATE)
+    new_page["🗓 Date"]["date"]["start"] = date_property
+    new_page["Sleep"]["number"] = dict_cleaned_data.get("total_daily_sleep", 0)
+    new_page["✍️"]["title"][0]["text"]["content"] = date_title
+
+    # Create the new page
+    response = notion.pages.create(
+        parent={"database_id": database_id},
+        icon={"emoji": "✍🏻"},
+        properties=new_page,
+        children=children,
+    )
 
-    except Exception as e:
-        logger.error("Error during page creation : %s", e)
+    logger.info("Page Created with id : %s ", response["id"])